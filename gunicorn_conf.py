@@ -0,0 +1,27 @@
+import os
+
+# ==================== GUNICORN ====================
+# Arranque: gunicorn -c gunicorn_conf.py juego_pardo:app
+bind = f"0.0.0.0:{os.getenv('PORT', 10000)}"
+
+# Un solo proceso por defecto: la cola PVP y el marketplace viven en memoria
+# del proceso, así que con varios workers los jugadores no se emparejarían
+# entre sí. La concurrencia escala con threads.
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+
+# Carga la app en el master antes de hacer fork
+preload_app = True
+
+def when_ready(server):
+    """Configura el webhook de Telegram una sola vez, desde el master"""
+    from juego_pardo import configure_webhook
+    configure_webhook()
+
+def post_fork(server, worker):
+    """Estado propio por worker: preload_app hereda el del master"""
+    from juego_pardo import reseed_rngs, reset_telegram_session
+    reseed_rngs()
+    # El master usó TG_SESSION en when_ready: no compartir su socket TLS
+    reset_telegram_session()
@@ -1,12 +1,24 @@
 import os
+import hmac
 import logging
 import random
+import bisect
+import time
+import itertools
+import threading
+from collections import defaultdict, OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from dotenv import load_dotenv
 
+import numpy as np
+import orjson
+
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import requests
+from requests.adapters import HTTPAdapter
 
 # ==================== CONFIGURACIÓN ====================
 load_dotenv(dotenv_path='juego_pardo.env')
@@ -16,6 +28,7 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 WEBHOOK_URL_BASE = os.getenv("WEBHOOK_URL")
 PORT = int(os.getenv("PORT", 10000))
 GAME_HTML_URL = os.getenv("GAME_HTML_URL")
+ADMIN_KEY = os.getenv("ADMIN_KEY")  # Opcional: habilita /api/marketplace/reroll
 
 if not all([BOT_TOKEN, SECRET_KEY, WEBHOOK_URL_BASE, GAME_HTML_URL]):
     print("❌ Error: Faltan variables de entorno")
@@ -28,54 +41,120 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ==================== TELEGRAM HTTP ====================
+# Sesión compartida: reutiliza conexiones keep-alive con api.telegram.org
+TG_API_TIMEOUT = 5
+
+def _new_tg_session():
+    """Crea una sesión con pool de conexiones HTTPS"""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return session
+
+TG_SESSION = _new_tg_session()
+
+def reset_telegram_session():
+    """Descarta las conexiones heredadas del master (llamar tras fork en cada worker)"""
+    global TG_SESSION
+    TG_SESSION.close()
+    TG_SESSION = _new_tg_session()
+
+# Teclado de /start: constante, se construye una sola vez al importar
+_START_KEYBOARD = {
+    "inline_keyboard": [[{
+        "text": "🎮 Jugar Pardo RPG",
+        "web_app": {"url": GAME_HTML_URL}
+    }]]
+}
+
+# Envíos en segundo plano: el webhook responde sin esperar a Telegram
+TG_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="tg-send")
+
+def _send_telegram_message(url, payload):
+    """Envía un mensaje a Telegram (se ejecuta en TG_EXECUTOR)"""
+    try:
+        response = TG_SESSION.post(url, json=payload, timeout=TG_API_TIMEOUT)
+        logger.info(f"Mensaje enviado: {response.status_code}")
+    except Exception as e:
+        logger.error(f"Error enviando mensaje: {e}", exc_info=True)
+
 # ==================== FLASK APP ====================
 app = Flask(__name__)
 app.config['SECRET_KEY'] = SECRET_KEY
+_ADMIN_KEY_BYTES = ADMIN_KEY.encode() if ADMIN_KEY else None  # Codificada una vez
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
 # ==================== CATÁLOGO DE MISIONES PVE ====================
-MISSIONS_CATALOG = {
-    1: {"name": "Rata Salvaje", "hp": 50, "power": 5, "dexterity": 3, "endurance": 2, "exp": 50, "gold": 10},
-    2: {"name": "Lobo Hambriento", "hp": 80, "power": 8, "dexterity": 5, "endurance": 4, "exp": 80, "gold": 15},
-    3: {"name": "Goblin Ladrón", "hp": 120, "power": 12, "dexterity": 8, "endurance": 6, "exp": 120, "gold": 25},
-    4: {"name": "Orco Guerrero", "hp": 180, "power": 18, "dexterity": 10, "endurance": 12, "exp": 180, "gold": 40},
-    5: {"name": "Troll de Piedra", "hp": 250, "power": 25, "dexterity": 12, "endurance": 20, "exp": 250, "gold": 60},
-    6: {"name": "Araña Gigante", "hp": 200, "power": 22, "dexterity": 18, "endurance": 15, "exp": 220, "gold": 50},
-    7: {"name": "Caballero Oscuro", "hp": 300, "power": 30, "dexterity": 20, "endurance": 25, "exp": 300, "gold": 80},
-    8: {"name": "Demonio Menor", "hp": 400, "power": 40, "dexterity": 25, "endurance": 30, "exp": 400, "gold": 120},
-    9: {"name": "Dragón Joven", "hp": 550, "power": 50, "dexterity": 30, "endurance": 40, "exp": 550, "gold": 180},
-    10: {"name": "Señor Oscuro", "hp": 750, "power": 65, "dexterity": 40, "endurance": 50, "exp": 750, "gold": 250}
-}
+Mission = namedtuple('Mission', 'name hp power dexterity endurance exp gold')
+
+# Indexado por mission_id - 1
+MISSIONS = (
+    Mission("Rata Salvaje", 50, 5, 3, 2, 50, 10),
+    Mission("Lobo Hambriento", 80, 8, 5, 4, 80, 15),
+    Mission("Goblin Ladrón", 120, 12, 8, 6, 120, 25),
+    Mission("Orco Guerrero", 180, 18, 10, 12, 180, 40),
+    Mission("Troll de Piedra", 250, 25, 12, 20, 250, 60),
+    Mission("Araña Gigante", 200, 22, 18, 15, 220, 50),
+    Mission("Caballero Oscuro", 300, 30, 20, 25, 300, 80),
+    Mission("Demonio Menor", 400, 40, 25, 30, 400, 120),
+    Mission("Dragón Joven", 550, 50, 30, 40, 550, 180),
+    Mission("Señor Oscuro", 750, 65, 40, 50, 750, 250)
+)
+
+def get_mission(mission_id):
+    """Retorna la misión (1..N) o None si el id no es válido"""
+    if isinstance(mission_id, int) and 1 <= mission_id <= len(MISSIONS):
+        return MISSIONS[mission_id - 1]
+    return None
+
+# ==================== ALEATORIEDAD ====================
+# Instancias propias (sin pasar por el estado global del módulo random)
+_rng = random.Random()
+# Generador NumPy para simular rondas en lote (simulate_rounds)
+_combat_rng = np.random.default_rng()
+
+def reseed_rngs():
+    """Resiembra los RNG del proceso (llamar tras fork en cada worker)"""
+    global _combat_rng
+    _rng.seed()
+    _combat_rng = np.random.default_rng()
+
+# ==================== TABLAS DE ITEMS ====================
+# Exactamente 8 tipos: se indexan con 3 bits aleatorios
+_ITEM_TYPES = ('Weapon', 'Shield', 'Helmet', 'Armor', 'Boots', 'Gloves', 'Amulet', 'Ring')
+
+# Rareza: pesos 50/30/15/5 precalculados como distribución acumulada
+_RARITY_CUM = (0.5, 0.8, 0.95, 1.0)
+_RARITY_NAMES = ('Común', 'Raro', 'Épico', 'Legendario')
+_RARITY_MULT = (1, 1.5, 2, 3)
 
 # ==================== FÓRMULAS DE COMBATE ====================
+@lru_cache(maxsize=512)
 def calculate_hit_chance(attacker_dex):
     """Probabilidad de golpe: 75% base + (Dex * 0.5%)"""
     return min(0.95, 0.75 + (attacker_dex * 0.005))
 
+@lru_cache(maxsize=512)
 def calculate_crit_chance(attacker_dex):
     """Probabilidad crítica: Dex * 0.1%"""
     return min(0.30, attacker_dex * 0.001)
 
+@lru_cache(maxsize=512)
 def calculate_block_chance(defender_end):
     """Probabilidad de bloqueo: End * 0.08%"""
     return min(0.25, defender_end * 0.0008)
 
-def calculate_base_damage(power):
-    """Daño base: Poder + Random(1, Poder*20%)"""
-    return power + random.randint(1, max(1, int(power * 0.2)))
+def calculate_base_damage(power, r):
+    """Daño base: Poder + Random(1, Poder*20%), con r uniforme en [0, 1) (float o array)"""
+    return power + (r * max(1, int(power * 0.2))) // 1 + 1
 
 def calculate_defense(endurance):
     """Defensa: Aguante * 1.5"""
     return endurance * 1.5
 
-def execute_attack(attacker, defender):
-    """
-    Ejecuta un ataque completo con todas las fórmulas.
-    Retorna: dict con resultado del ataque
-    """
-    # 1. Verificar si el ataque acierta
-    hit_chance = calculate_hit_chance(attacker['dexterity'])
-    if random.random() > hit_chance:
+def _format_attack(hit, damage, is_critical, is_blocked):
+    """Construye el dict de resultado de un ataque"""
+    if not hit:
         return {
             "hit": False,
             "damage": 0,
@@ -84,36 +163,85 @@ def execute_attack(attacker, defender):
             "message": "¡Ataque fallado!"
         }
     
+    return {
+        "hit": True,
+        "damage": damage,
+        "critical": is_critical,
+        "blocked": is_blocked,
+        "message": f"{'¡CRÍTICO! ' if is_critical else ''}Daño: {damage}{' (BLOQUEADO)' if is_blocked else ''}"
+    }
+
+def simulate_rounds(attacker, defender, n):
+    """
+    Simula n ataques de una vez con NumPy.
+    Retorna: lista de dicts con el mismo formato que execute_attack
+    """
+    power = attacker['power']
+    endurance = defender['endurance']
+    hit_chance = calculate_hit_chance(attacker['dexterity'])
+    crit_chance = calculate_crit_chance(attacker['dexterity'])
+    block_chance = calculate_block_chance(endurance)
+    
+    # Columnas: acierto, crítico, bloqueo, daño aleatorio
+    r = _combat_rng.random((n, 4))
+    hit_mask = r[:, 0] <= hit_chance
+    crit_mask = hit_mask & (r[:, 1] < crit_chance)
+    block_mask = hit_mask & (r[:, 2] < block_chance)
+    
+    base = calculate_base_damage(power, r[:, 3]) * np.where(crit_mask, 2, 1)
+    defense = calculate_defense(endurance) * np.where(block_mask, 2, 1)
+    final = np.where(hit_mask, np.maximum(1, base - defense), 0).astype(int)
+    
+    return [
+        _format_attack(hit, damage, crit, blocked)
+        for hit, damage, crit, blocked in zip(
+            hit_mask.tolist(), final.tolist(), crit_mask.tolist(), block_mask.tolist()
+        )
+    ]
+
+def execute_attack(attacker, defender, n_rounds=None):
+    """
+    Ejecuta un ataque completo con todas las fórmulas.
+    Con n_rounds retorna una lista de rondas simuladas en lote.
+    Retorna: dict con resultado del ataque
+    """
+    if n_rounds is not None:
+        if n_rounds == 1:
+            return [execute_attack(attacker, defender)]
+        return simulate_rounds(attacker, defender, n_rounds)
+    
+    # Ronda suelta: el Random escalar es más rápido que una llamada a NumPy
+    r_hit, r_crit, r_block, r_dmg = _rng.random(), _rng.random(), _rng.random(), _rng.random()
+    
+    # 1. Verificar si el ataque acierta
+    if r_hit > calculate_hit_chance(attacker['dexterity']):
+        return _format_attack(False, 0, False, False)
+    
     # 2. Calcular daño base
-    base_damage = calculate_base_damage(attacker['power'])
+    base_damage = calculate_base_damage(attacker['power'], r_dmg)
     
     # 3. Verificar crítico (x2 daño)
-    is_critical = random.random() < calculate_crit_chance(attacker['dexterity'])
+    is_critical = r_crit < calculate_crit_chance(attacker['dexterity'])
     if is_critical:
         base_damage *= 2
     
     # 4. Verificar bloqueo del defensor (x2 defensa)
     defense = calculate_defense(defender['endurance'])
-    is_blocked = random.random() < calculate_block_chance(defender['endurance'])
+    is_blocked = r_block < calculate_block_chance(defender['endurance'])
     if is_blocked:
         defense *= 2
     
     # 5. Calcular daño final
     final_damage = max(1, base_damage - defense)
     
-    return {
-        "hit": True,
-        "damage": int(final_damage),
-        "critical": is_critical,
-        "blocked": is_blocked,
-        "message": f"{'¡CRÍTICO! ' if is_critical else ''}Daño: {int(final_damage)}{' (BLOQUEADO)' if is_blocked else ''}"
-    }
+    return _format_attack(True, int(final_damage), is_critical, is_blocked)
 
 # ==================== API - COMBATE PVE ====================
 @app.route('/api/pve/mission/<int:mission_id>', methods=['POST'])
 def start_pve_mission(mission_id):
     """Inicia una misión PVE contra un monstruo"""
-    if mission_id not in MISSIONS_CATALOG:
+    mission = get_mission(mission_id)
+    if not mission:
         return jsonify({"error": "Misión no encontrada"}), 404
     
     data = request.json
@@ -122,14 +250,30 @@ def start_pve_mission(mission_id):
     if not player_stats:
         return jsonify({"error": "Stats del jugador requeridos"}), 400
     
-    mission = MISSIONS_CATALOG[mission_id]
-    
     return jsonify({
         "mission_id": mission_id,
-        "enemy": mission,
+        "enemy": mission._asdict(),
         "player": player_stats
     })
 
+MAX_STAT = 100000
+
+def _is_number(value):
+    """True para int/float de JSON (bool no cuenta como número)"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def validate_combatants(attacker, defender):
+    """Valida los stats de combate; retorna un mensaje de error o None"""
+    if not isinstance(attacker, dict) or not isinstance(defender, dict):
+        return "Datos incompletos"
+    
+    stats = (attacker.get('dexterity'), attacker.get('power'), defender.get('endurance'))
+    # La comparación de rango también descarta NaN e Infinity
+    if not all(_is_number(stat) and 0 <= stat <= MAX_STAT for stat in stats):
+        return f"Stats inválidos (0-{MAX_STAT})"
+    
+    return None
+
 @app.route('/api/pve/attack', methods=['POST'])
 def pve_attack():
     """Procesa un ataque en combate PVE"""
@@ -137,12 +281,32 @@ def pve_attack():
     attacker = data.get('attacker')
     defender = data.get('defender')
     
-    if not attacker or not defender:
-        return jsonify({"error": "Datos incompletos"}), 400
+    error = validate_combatants(attacker, defender)
+    if error:
+        return jsonify({"error": error}), 400
     
     result = execute_attack(attacker, defender)
     return jsonify(result)
 
+MAX_BATCH_ROUNDS = 1000
+
+@app.route('/api/pve/attack_batch', methods=['POST'])
+def pve_attack_batch():
+    """Simula varias rondas de ataque en una sola petición"""
+    data = request.json
+    attacker = data.get('attacker')
+    defender = data.get('defender')
+    rounds = data.get('rounds', 1)
+    
+    error = validate_combatants(attacker, defender)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    if isinstance(rounds, bool) or not isinstance(rounds, int) or not 1 <= rounds <= MAX_BATCH_ROUNDS:
+        return jsonify({"error": f"Rondas inválidas (1-{MAX_BATCH_ROUNDS})"}), 400
+    
+    return jsonify({"rounds": execute_attack(attacker, defender, n_rounds=rounds)})
+
 @app.route('/api/pve/complete', methods=['POST'])
 def complete_pve_mission():
     """Completa una misión PVE y genera drop de item"""
@@ -154,20 +318,19 @@ def complete_pve_mission():
     if not mission_id or not user_id:
         return jsonify({"error": "Datos incompletos"}), 400
     
-    mission = MISSIONS_CATALOG.get(mission_id)
+    mission = get_mission(mission_id)
     if not mission:
         return jsonify({"error": "Misión inválida"}), 404
     
     # Calcular recompensas
-    exp_reward = mission['exp'] if victory else mission['exp'] // 2
-    gold_reward = mission['gold'] if victory else mission['gold'] // 3
+    exp_reward = mission.exp if victory else mission.exp // 2
+    gold_reward = mission.gold if victory else mission.gold // 3
     
     # Generar drop de item (nivel misión ±10)
     item_drop = None
-    if victory and random.random() < 0.4:  # 40% drop rate
-        item_types = ['Weapon', 'Shield', 'Helmet', 'Armor', 'Boots', 'Gloves', 'Amulet', 'Ring']
-        item_type = random.choice(item_types)
-        item_level = mission_id + random.randint(0, 10)
+    if victory and _rng.random() < 0.4:  # 40% drop rate
+        item_type = _ITEM_TYPES[_rng.getrandbits(3) & 7]
+        item_level = mission_id + _rng.randint(0, 10)
         
         item_drop = generate_random_item(item_type, item_level)
     
@@ -178,20 +341,22 @@ def complete_pve_mission():
         "message": "¡Victoria!" if victory else "Derrota"
     })
 
-def generate_random_item(item_type, level):
-    """Genera un item aleatorio basado en nivel"""
-    rarity = random.choices(['Común', 'Raro', 'Épico', 'Legendario'], weights=[50, 30, 15, 5])[0]
-    multiplier = {'Común': 1, 'Raro': 1.5, 'Épico': 2, 'Legendario': 3}[rarity]
+def generate_random_item(item_type, level, rng=_rng):
+    """Genera un item aleatorio basado en nivel (rng: fuente de aleatoriedad)"""
+    idx = bisect.bisect_right(_RARITY_CUM, rng.random())
+    rarity = _RARITY_NAMES[idx]
+    multiplier = _RARITY_MULT[idx]
     
     base_stats = int(level * 0.5 * multiplier)
+    bonus = rng.getrandbits(2)  # 0-3: cada tipo usa como mucho un stat
     
     stats = {}
     if item_type in ['Weapon', 'Gloves']:
-        stats['power'] = base_stats + random.randint(0, 3)
+        stats['power'] = base_stats + bonus
     if item_type in ['Boots', 'Ring']:
-        stats['dexterity'] = base_stats + random.randint(0, 3)
+        stats['dexterity'] = base_stats + bonus
     if item_type in ['Shield', 'Armor', 'Helmet']:
-        stats['endurance'] = base_stats + random.randint(0, 3)
+        stats['endurance'] = base_stats + bonus
     if item_type == 'Amulet':
         stats['life'] = base_stats * 10
     
@@ -204,34 +369,114 @@ def generate_random_item(item_type, level):
     }
 
 # ==================== API - MARKETPLACE ====================
-@app.route('/api/marketplace/items', methods=['GET'])
-def get_marketplace_items():
-    """Retorna catálogo completo de items clasificados"""
-    item_type = request.args.get('type', None)
-    
-    # Generar catálogo por tipo
+# RNG propio sembrado una vez: el catálogo es estable entre peticiones y clientes
+_mk_rng = random.Random(42)
+
+Marketplace = namedtuple('Marketplace', 'catalog json by_type')
+
+def build_marketplace():
+    """Genera el catálogo completo y su JSON serializado con orjson (total y por tipo)"""
     marketplace = {}
-    for itype in ['Weapon', 'Shield', 'Helmet', 'Armor', 'Boots', 'Gloves', 'Amulet', 'Ring']:
+    for itype in _ITEM_TYPES:
         items = []
         for level in range(1, 101, 5):  # Items cada 5 niveles
-            item = generate_random_item(itype, level)
+            item = generate_random_item(itype, level, rng=_mk_rng)
             item['price'] = level * 20  # Precio basado en nivel
             items.append(item)
         marketplace[itype] = items
     
+    by_type = {itype: orjson.dumps(items) for itype, items in marketplace.items()}
+    return Marketplace(marketplace, orjson.dumps(marketplace), by_type)
+
+# Se reemplaza como un único objeto: un GET nunca mezcla catálogos
+_marketplace = build_marketplace()
+
+@app.route('/api/marketplace/items', methods=['GET'])
+def get_marketplace_items():
+    """Retorna catálogo completo de items clasificados"""
+    item_type = request.args.get('type', None)
+    market = _marketplace
+    
     if item_type:
-        return jsonify(marketplace.get(item_type, []))
+        body = market.by_type.get(item_type, b'[]')
+    else:
+        body = market.json
+    
+    return app.response_class(body, mimetype='application/json')
+
+@app.route('/api/marketplace/reroll', methods=['POST'])
+def reroll_marketplace():
+    """Regenera el catálogo del marketplace de este proceso (requiere X-Admin-Key = ADMIN_KEY)"""
+    global _marketplace
     
-    return jsonify(marketplace)
+    if _ADMIN_KEY_BYTES is None:
+        return jsonify({"error": "Reroll deshabilitado"}), 403
+    
+    admin_key = request.headers.get('X-Admin-Key', '')
+    if not hmac.compare_digest(admin_key.encode(), _ADMIN_KEY_BYTES):
+        return jsonify({"error": "No autorizado"}), 403
+    
+    _marketplace = build_marketplace()
+    logger.info("🛒 Marketplace regenerado")
+    return jsonify({"status": "ok", "types": len(_marketplace.catalog)})
 
 # ==================== API - PVP MATCHMAKING ====================
-pvp_queue = {}  # {user_id: {level, stats, timestamp}}
+# Cola por cubetas de nivel (level // 5): un rival ±5 niveles está en b-1, b o b+1
+PVP_BUCKET_SIZE = 5
+pvp_buckets = defaultdict(OrderedDict)  # {bucket: {user_id: {level, stats, timestamp, seq}}}
+user_bucket = {}  # {user_id: bucket}
+_pvp_lock = threading.Lock()
+_pvp_seq = itertools.count()  # Orden de llegada e ids de match únicos
+
+def _pvp_remove(user_id):
+    """Saca a un usuario de la cola en O(1)"""
+    bucket = user_bucket.pop(user_id, None)
+    if bucket is not None:
+        del pvp_buckets[bucket][user_id]
+        if not pvp_buckets[bucket]:
+            del pvp_buckets[bucket]
+
+def _pvp_enqueue(user_id, level, stats):
+    """Encola o actualiza a un usuario conservando su turno (seq) original"""
+    bucket = level // PVP_BUCKET_SIZE
+    old_bucket = user_bucket.get(user_id)
+    entry = {"level": level, "stats": stats, "timestamp": time.time()}
+    
+    if old_bucket is None:
+        entry["seq"] = next(_pvp_seq)
+        pvp_buckets[bucket][user_id] = entry
+    elif old_bucket == bucket:
+        # Misma cubeta: actualizar en sitio mantiene la posición FIFO
+        entry["seq"] = pvp_buckets[bucket][user_id]["seq"]
+        pvp_buckets[bucket][user_id] = entry
+    else:
+        # Cambió de cubeta: reinsertar con su seq. La cubeta destino está vacía,
+        # porque cualquier otro jugador en ella (±4 niveles) ya habría emparejado
+        entry["seq"] = pvp_buckets[old_bucket][user_id]["seq"]
+        _pvp_remove(user_id)
+        pvp_buckets[bucket][user_id] = entry
+    
+    user_bucket[user_id] = bucket
+
+def _pvp_find_opponent(level, user_id):
+    """Busca el rival más antiguo en rango ±5 niveles en las cubetas vecinas"""
+    bucket = level // PVP_BUCKET_SIZE
+    best = None
+    for b in (bucket - 1, bucket, bucket + 1):
+        if b not in pvp_buckets:
+            continue
+        for uid, player_data in pvp_buckets[b].items():
+            if uid == user_id:
+                continue
+            if abs(player_data['level'] - level) <= 5:
+                if best is None or player_data['seq'] < best[1]['seq']:
+                    best = (uid, player_data)
+                break  # FIFO: el primero válido de cada cubeta es el más antiguo
+    return best
 
 @app.route('/api/pvp/join_queue', methods=['POST'])
 def join_pvp_queue():
     """Unirse a la cola PVP"""
-    import time
-    
     data = request.json
     user_id = data.get('user_id')
     level = data.get('level')
@@ -240,24 +485,29 @@ def join_pvp_queue():
     if level < 10:
         return jsonify({"error": "Nivel mínimo 10 para PVP"}), 400
     
-    # Buscar oponente en rango ±5 niveles
-    opponent = None
-    for uid, player_data in list(pvp_queue.items()):
-        if abs(player_data['level'] - level) <= 5 and uid != user_id:
-            opponent = {"user_id": uid, **player_data}
-            del pvp_queue[uid]
-            break
+    with _pvp_lock:
+        # Buscar oponente en rango ±5 niveles (nunca uno mismo)
+        opponent = None
+        match = _pvp_find_opponent(level, user_id)
+        if match:
+            uid, player_data = match
+            _pvp_remove(uid)
+            # Si el usuario ya esperaba en cola, su entrada queda obsoleta
+            _pvp_remove(user_id)
+            opponent = {"user_id": uid, "level": player_data['level'],
+                        "stats": player_data['stats'], "timestamp": player_data['timestamp']}
+        else:
+            # Añadir a cola (o refrescar sin perder el turno)
+            _pvp_enqueue(user_id, level, stats)
     
     if opponent:
         # Match encontrado
         return jsonify({
             "match_found": True,
             "opponent": opponent,
-            "match_id": f"{user_id}_{opponent['user_id']}_{int(time.time())}"
+            "match_id": f"{user_id}_{opponent['user_id']}_{next(_pvp_seq)}"
         })
     else:
-        # Añadir a cola
-        pvp_queue[user_id] = {"level": level, "stats": stats, "timestamp": time.time()}
         return jsonify({"match_found": False, "message": "Buscando oponente..."})
 
 @app.route('/api/pvp/attack', methods=['POST'])
@@ -291,17 +541,11 @@ def telegram_webhook():
                         "⚔️ Nivel 10+: Combate PVP en tiempo real\n\n"
                         "Haz clic para empezar tu aventura."
                     ),
-                    "reply_markup": {
-                        "inline_keyboard": [[{
-                            "text": "🎮 Jugar Pardo RPG",
-                            "web_app": {"url": GAME_HTML_URL}
-                        }]]
-                    }
+                    "reply_markup": _START_KEYBOARD
                 }
                 
-                # Enviar mensaje usando requests (síncrono)
-                response = requests.post(url, json=payload)
-                logger.info(f"Mensaje enviado: {response.status_code}")
+                # Enviar mensaje en segundo plano con la sesión compartida
+                TG_EXECUTOR.submit(_send_telegram_message, url, payload)
         
         return "ok", 200
         
@@ -320,7 +564,7 @@ def configure_webhook():
         webhook_url = f"{WEBHOOK_URL_BASE}/webhook"
         url = f"https://api.telegram.org/bot{BOT_TOKEN}/setWebhook"
         
-        resp = requests.post(url, json={"url": webhook_url})
+        resp = TG_SESSION.post(url, json={"url": webhook_url}, timeout=TG_API_TIMEOUT)
         
         if resp.status_code == 200:
             logger.info(f"✅ Webhook configurado: {webhook_url}")
@@ -331,14 +575,26 @@ def configure_webhook():
         logger.error(f"Error configurando webhook: {e}")
 
 # ==================== HEALTH CHECK ====================
+_iso_cache = (0, "")  # (segundo, timestamp ISO); se reemplaza como tupla completa
+
+def _iso_now():
+    """Timestamp ISO con resolución de 1 segundo, formateado una vez por segundo"""
+    global _iso_cache
+    now = int(time.time())
+    sec, iso = _iso_cache
+    if now != sec:
+        iso = datetime.fromtimestamp(now).isoformat()
+        _iso_cache = (now, iso)
+    return iso
+
 @app.route('/health', methods=['GET'])
 def health():
     """Endpoint de health check"""
     return jsonify({
         "status": "ok", 
         "bot": "pardo_rpg",
-        "missions": len(MISSIONS_CATALOG),
-        "timestamp": datetime.now().isoformat()
+        "missions": len(MISSIONS),
+        "timestamp": _iso_now()
     }), 200
 
 @app.route('/', methods=['GET'])
@@ -352,6 +608,7 @@ def index():
             "/webhook",
             "/api/pve/mission/<id>",
             "/api/pve/attack",
+            "/api/pve/attack_batch",
             "/api/pve/complete",
             "/api/pvp/join_queue",
             "/api/marketplace/items"
@@ -365,10 +622,10 @@ if __name__ == '__main__':
     logger.info(f"URL del Juego: {GAME_HTML_URL}")
     logger.info(f"Webhook: {WEBHOOK_URL_BASE}/webhook")
     logger.info(f"Puerto: {PORT}")
-    logger.info(f"Misiones PVE: {len(MISSIONS_CATALOG)}")
+    logger.info(f"Misiones PVE: {len(MISSIONS)}")
     logger.info("="*50)
     
     configure_webhook()
     
-    # Usar el puerto de Render
+    # Servidor de desarrollo; en producción: gunicorn -c gunicorn_conf.py juego_pardo:app
     app.run(host='0.0.0.0', port=PORT, debug=False)